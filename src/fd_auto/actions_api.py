@@ -1,17 +1,19 @@
+import codecs
+import datetime
+import http.client
 import io
-import json
-import os
+import shutil
 import time
 import urllib.request
 import urllib.error
 
 import zipfile
-class _NoRedirect(urllib.request.HTTPRedirectHandler):
-    def redirect_request(self, req, fp, code, msg, headers, newurl):
-        return None
 
 from typing import Any, Dict, List
 
+# one implementation of the GitHub REST plumbing (auth headers, retries, JSON) for both modules
+from src.fd_auto.github_api import _get_json, _get_json_conditional, _headers, _post_json, _repo, _request
+
 def _read_http_error_body(e: urllib.error.HTTPError) -> str:
     try:
         b = e.read()
@@ -21,38 +23,21 @@ def _read_http_error_body(e: urllib.error.HTTPError) -> str:
     except Exception:
         return ""
 
-def _repo() -> str:
-    r = (os.environ.get("GITHUB_REPOSITORY") or "").strip()
-    if r == "":
-        raise RuntimeError("FD_FAIL: missing GITHUB_REPOSITORY")
-    return r
-
-def _headers(token: str) -> Dict[str, str]:
-    return {
-        "Authorization": "Bearer " + token,
-        "Accept": "application/vnd.github+json",
-        "User-Agent": "fd-auto",
-    }
-
-def _get_json(url: str, token: str) -> Any:
-    req = urllib.request.Request(url, headers=_headers(token), method="GET")
+def _parse_gh_time(s: str) -> float:
+    # GitHub timestamps are UTC ("...Z"); parse as aware datetimes, not local time.
     try:
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as e:
-        body = _read_http_error_body(e)
-        raise RuntimeError("FD_GH_HTTP_ERROR method=GET url=" + url + " status=" + str(e.code) + " body=" + body) from e
+        return datetime.datetime.fromisoformat(s.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
 
-def _post_json(url: str, token: str, payload: Dict[str, Any]) -> None:
-    body = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(url, headers=_headers(token), data=body, method="POST")
-    req.add_header("content-type", "application/json; charset=utf-8")
+def _poll_sleep(headers: http.client.HTTPMessage, backoff: float, deadline: float) -> None:
+    # Honor GitHub's X-Poll-Interval, never poll faster than the current backoff step.
     try:
-        with urllib.request.urlopen(req, timeout=60):
-            pass
-    except urllib.error.HTTPError as e:
-        eb = _read_http_error_body(e)
-        raise RuntimeError("FD_GH_HTTP_ERROR method=POST url=" + url + " status=" + str(e.code) + " body=" + eb) from e
+        hinted = float(int(headers.get("X-Poll-Interval") or 0))
+    except ValueError:
+        hinted = 0.0
+    delay = max(1.0, hinted, backoff)
+    time.sleep(max(0.0, min(delay, deadline - time.time())))
 
 def dispatch_workflow(workflow_file: str, ref: str, inputs: Dict[str, str], token: str) -> None:
     repo = _repo()
@@ -66,10 +51,14 @@ def dispatch_workflow(workflow_file: str, ref: str, inputs: Dict[str, str], toke
 def find_latest_run_id(workflow_file: str, branch: str, not_before_epoch: float, token: str, timeout_s: int = 180) -> int:
     repo = _repo()
     wf = workflow_file.strip()
+    url = f"https://api.github.com/repos/{repo}/actions/workflows/{wf}/runs?per_page=20&branch={branch}&event=workflow_dispatch"
     deadline = time.time() + timeout_s
+    etag = ""
+    backoff = 2.0
     while time.time() < deadline:
-        url = f"https://api.github.com/repos/{repo}/actions/workflows/{wf}/runs?per_page=20&branch={branch}&event=workflow_dispatch"
-        data = _get_json(url, token)
+        data, headers = _get_json_conditional(url, token, etag)
+        if data is not None:
+            etag = headers.get("ETag") or ""
         runs = data.get("workflow_runs") if isinstance(data, dict) else None
         if isinstance(runs, list):
             for r in runs:
@@ -79,60 +68,94 @@ def find_latest_run_id(workflow_file: str, branch: str, not_before_epoch: float,
                 run_id = int(r.get("id") or 0)
                 if run_id <= 0:
                     continue
-                try:
-                    tt = time.strptime(created, "%Y-%m-%dT%H:%M:%SZ")
-                    epoch = time.mktime(tt)
-                except Exception:
-                    epoch = 0
+                epoch = _parse_gh_time(created)
                 if epoch >= not_before_epoch:
                     return run_id
-        time.sleep(3)
+        _poll_sleep(headers, backoff, deadline)
+        backoff = min(backoff * 2, 10.0)
     raise RuntimeError("FD_FAIL: could not find workflow run for " + wf + " branch=" + branch)
 
 def wait_run_complete(run_id: int, token: str, timeout_s: int = 3600) -> Dict[str, Any]:
     repo = _repo()
+    url = f"https://api.github.com/repos/{repo}/actions/runs/{run_id}"
     deadline = time.time() + timeout_s
+    etag = ""
+    backoff = 3.0
     while time.time() < deadline:
-        url = f"https://api.github.com/repos/{repo}/actions/runs/{run_id}"
-        data = _get_json(url, token)
+        data, headers = _get_json_conditional(url, token, etag)
+        if data is not None:
+            etag = headers.get("ETag") or ""
         if isinstance(data, dict):
             if str(data.get("status") or "") == "completed":
                 return data
-        time.sleep(5)
+        _poll_sleep(headers, backoff, deadline)
+        backoff = min(backoff * 2, 30.0)
     raise RuntimeError("FD_FAIL: workflow run timeout run_id=" + str(run_id))
 
+def _open_signed_redirect(url: str, token: str, timeout: float) -> Any:
+    # The API hop rides the pooled keep-alive connection. GitHub answers with a 302 to
+    # a short-lived signed URL on another host, which is fetched without auth headers.
+    status, headers, data = _request("GET", url, _headers(token), timeout=timeout)
+    if status in (301, 302, 303, 307, 308):
+        loc = headers.get("Location") or ""
+        if loc:
+            return urllib.request.urlopen(urllib.request.Request(loc, method="GET"), timeout=timeout)
+    if status >= 300:
+        body = data.decode("utf-8", errors="replace")
+        raise RuntimeError("FD_GH_HTTP_ERROR method=GET url=" + url + " status=" + str(status) + " body=" + body)
+    return io.BytesIO(data)
+
 def download_run_logs_zip(run_id: int, token: str) -> bytes:
     repo = _repo()
     url = f"https://api.github.com/repos/{repo}/actions/runs/{run_id}/logs"
-    req = urllib.request.Request(url, headers=_headers(token), method="GET")
     try:
-        with urllib.request.urlopen(req, timeout=120) as resp:
+        with _open_signed_redirect(url, token, 120) as resp:
             return resp.read()
     except urllib.error.HTTPError as e:
         body = _read_http_error_body(e)
         raise RuntimeError("FD_GH_HTTP_ERROR method=GET url=" + url + " status=" + str(e.code) + " body=" + body) from e
 
+def _read_decoded(z: zipfile.ZipFile, zi: zipfile.ZipInfo, need: int) -> str:
+    # Inflate and decode only until need chars are out. errors="ignore" drops invalid
+    # bytes, so a byte budget alone could stop short; the incremental decoder keeps
+    # the result a prefix of decoding the whole member.
+    dec = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts: List[str] = []
+    got = 0
+    with z.open(zi) as f:
+        while got < need:
+            # UTF-8 is at most 4 bytes/char: one read suffices unless bytes get dropped
+            raw = f.read((need - got) * 4)
+            if not raw:
+                parts.append(dec.decode(b"", final=True))
+                break
+            s = dec.decode(raw)
+            parts.append(s)
+            got += len(s)
+    return "".join(parts)
+
 def extract_logs_text(logs_zip: bytes, max_chars: int = 400000) -> str:
     buf = io.BytesIO(logs_zip)
     z = zipfile.ZipFile(buf, "r")
-    texts: List[str] = []
+    pieces: List[str] = []
     total = 0
-    for name in z.namelist():
+    for zi in z.infolist():
+        name = zi.filename
         if not name.endswith(".txt"):
             continue
         try:
-            data = z.read(name).decode("utf-8", errors="ignore")
+            data = _read_decoded(z, zi, max_chars - total + 1)
         except Exception:
             continue
-        block = "### " + name + "\n" + data
-        texts.append(block)
-        total += len(block)
-        if total > max_chars:
+        block = ("\n\n" if pieces else "") + "### " + name + "\n" + data
+        # total tracks the joined length, so the cap is applied once, on the last block
+        room = max_chars - total
+        if len(block) >= room:
+            pieces.append(block[:room])
             break
-    out = "\n\n".join(texts)
-    if len(out) > max_chars:
-        out = out[:max_chars]
-    return out
+        pieces.append(block)
+        total += len(block)
+    return "".join(pieces)
 
 def list_run_artifacts(run_id: int, token: str) -> List[Dict[str, Any]]:
     repo = _repo()
@@ -143,20 +166,16 @@ def list_run_artifacts(run_id: int, token: str) -> List[Dict[str, Any]]:
         return [a for a in arts if isinstance(a, dict)]
     return []
 
-def download_artifact_zip(artifact_id: int, token: str) -> bytes:
+def _open_artifact(artifact_id: int, token: str) -> Any:
     repo = _repo()
     url = f"https://api.github.com/repos/{repo}/actions/artifacts/{artifact_id}/zip"
-    req = urllib.request.Request(url, headers=_headers(token), method="GET")
-    opener = urllib.request.build_opener(_NoRedirect)
-    try:
-        with opener.open(req, timeout=120) as resp:
-            return resp.read()
-    except urllib.error.HTTPError as e:
-        # GitHub returns 302 to a signed URL; follow it without auth headers.
-        if e.code in (301, 302, 303, 307, 308):
-            loc = e.headers.get("Location") or e.headers.get("location") or ""
-            if loc:
-                req2 = urllib.request.Request(loc, method="GET")
-                with urllib.request.urlopen(req2, timeout=120) as resp2:
-                    return resp2.read()
-        raise
+    return _open_signed_redirect(url, token, 120)
+
+def download_artifact_zip(artifact_id: int, token: str) -> bytes:
+    with _open_artifact(artifact_id, token) as resp:
+        return resp.read()
+
+def download_artifact_to_file(artifact_id: int, token: str, out_path: str) -> None:
+    # Streams in 1 MiB chunks so large artifacts never sit in memory whole.
+    with _open_artifact(artifact_id, token) as resp, open(out_path, "wb") as f:
+        shutil.copyfileobj(resp, f, 1 << 20)
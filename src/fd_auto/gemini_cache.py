@@ -0,0 +1,90 @@
+import hashlib
+import os
+import stat
+import tempfile
+import time
+
+from src.fd_auto import gemini_client
+from src.fd_auto.util import env, env_int
+
+# Exact-match response cache: a prompt that was already answered (same text, model and
+# generation knobs) is served from disk instead of another Gemini round trip. Only
+# successful responses are stored, and callers that reject answers (the tune fix loop)
+# store only the ones they accept. FD_GEMINI_CACHE=0 disables it.
+#
+# Cached answers are applied as code, so the directory must be private: it is per-user,
+# created 0700, and any directory not owned by this uid or open to group/other is
+# refused (the cache is then bypassed). Entries expire after FD_GEMINI_CACHE_TTL_S.
+_TTL_S = env_int("FD_GEMINI_CACHE_TTL_S", 86400)
+
+def _enabled() -> bool:
+    return env("FD_GEMINI_CACHE", "1") != "0"
+
+def _uid() -> int:
+    return os.getuid() if hasattr(os, "getuid") else -1
+
+def _cache_dir() -> str:
+    # outside the repo tree so build/tune `git add -A` never picks it up; "" when the
+    # directory cannot be trusted
+    d = env("FD_GEMINI_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "fd_gemini_cache-" + str(_uid()))
+    try:
+        os.makedirs(d, mode=0o700, exist_ok=True)
+        st = os.lstat(d)
+    except OSError:
+        return ""
+    if not stat.S_ISDIR(st.st_mode):
+        return ""  # also rejects a symlink planted at the path
+    if hasattr(os, "getuid") and (st.st_uid != _uid() or st.st_mode & 0o077):
+        return ""
+    return d
+
+def _key(prompt: str) -> str:
+    h = hashlib.sha256()
+    model = (os.environ.get("GEMINI_MODEL") or gemini_client.DEFAULT_MODEL).strip()
+    base = (os.environ.get("GEMINI_ENDPOINT_BASE") or gemini_client.DEFAULT_ENDPOINT).strip()
+    knobs = "|".join([base, model, str(gemini_client._THINK_BUDGET), str(gemini_client._MAX_OUT), gemini_client._RESP_MIME])
+    h.update(knobs.encode("utf-8"))
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8", errors="surrogatepass"))
+    return h.hexdigest()
+
+def _path(prompt: str) -> str:
+    d = _cache_dir()
+    return os.path.join(d, _key(prompt) + ".txt") if d else ""
+
+def store_response(prompt: str, resp: str) -> None:
+    # Record resp as the answer for prompt. Callers that validate answers pass
+    # store_result=False to cached_call and store only what they accepted.
+    if not _enabled():
+        return
+    path = _path(prompt)
+    if not path:
+        return
+    try:
+        # unique temp name + os.replace: concurrent writers never expose a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(resp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass  # the cache is best-effort; the response is still good
+
+def cached_call(prompt: str, timeout_s: int = 900, store_result: bool = True) -> str:
+    if not _enabled():
+        return gemini_client.call_gemini(prompt, timeout_s=timeout_s)
+    path = _path(prompt)
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime < _TTL_S:
+                    return f.read()
+        except OSError:
+            pass
+    resp = gemini_client.call_gemini(prompt, timeout_s=timeout_s)
+    if store_result:
+        store_response(prompt, resp)
+    return resp
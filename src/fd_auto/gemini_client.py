@@ -1,20 +1,17 @@
-import json
 import os
 import time
-import urllib.error
-import urllib.request
+
+from src.fd_auto import http_pool
+from src.fd_auto.util import env_int, json_dumps, json_loads
 
 DEFAULT_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta"
 DEFAULT_MODEL = "gemini-2.5-pro"
 
-def _env_int(name: str, default: int) -> int:
-    v = (os.environ.get(name) or "").strip()
-    if v == "":
-        return default
-    try:
-        return int(v)
-    except Exception:
-        return default
+# Tuning knobs are fixed for a run: read once at import, not on every call.
+_RETRIES = env_int("FD_GEMINI_RETRIES", 2)
+_THINK_BUDGET = env_int("FD_GEMINI_THINKING_BUDGET", 1024)
+_MAX_OUT = env_int("FD_GEMINI_MAX_OUTPUT_TOKENS", 0)  # 0 => omit
+_RESP_MIME = (os.environ.get("FD_GEMINI_RESPONSE_MIME") or "text/plain").strip()
 
 def _endpoint(base: str, model: str) -> str:
     b = (base or DEFAULT_ENDPOINT).rstrip("/")
@@ -28,46 +25,37 @@ def call_gemini(prompt: str, timeout_s: int = 900) -> str:
     base = (os.environ.get("GEMINI_ENDPOINT_BASE") or DEFAULT_ENDPOINT).strip()
     url = _endpoint(base, model)
 
-    retries = _env_int("FD_GEMINI_RETRIES", 2)
-    think_budget = _env_int("FD_GEMINI_THINKING_BUDGET", 1024)
-    max_out = _env_int("FD_GEMINI_MAX_OUTPUT_TOKENS", 0)  # 0 => omit
-    resp_mime = (os.environ.get("FD_GEMINI_RESPONSE_MIME") or "text/plain").strip()
-
-    def payload() -> dict:
-        gen = {
-            "temperature": 0.2,
-            "responseMimeType": resp_mime,
-            "thinkingConfig": {"includeThoughts": False, "thinkingBudget": (think_budget if think_budget > 0 else 1)},
-        }
-        if max_out > 0:
-            gen["maxOutputTokens"] = max_out
-        return {"contents": [{"role": "user", "parts": [{"text": prompt}]}], "generationConfig": gen}
+    gen = {
+        "temperature": 0.2,
+        "responseMimeType": _RESP_MIME,
+        "thinkingConfig": {"includeThoughts": False, "thinkingBudget": (_THINK_BUDGET if _THINK_BUDGET > 0 else 1)},
+    }
+    if _MAX_OUT > 0:
+        gen["maxOutputTokens"] = _MAX_OUT
+    # the request is identical on every attempt: serialize once
+    body = json_dumps({"contents": [{"role": "user", "parts": [{"text": prompt}]}], "generationConfig": gen})
+    headers = {
+        "content-type": "application/json; charset=utf-8",
+        "x-goog-api-key": api_key,
+    }
 
-    last_raw = ""
-    for attempt in range(1, retries + 1):
-        body = json.dumps(payload()).encode("utf-8")
-        req = urllib.request.Request(url=url, data=body, method="POST")
-        req.add_header("content-type", "application/json; charset=utf-8")
-        req.add_header("x-goog-api-key", api_key)
+    last_raw = b""
+    for attempt in range(1, _RETRIES + 1):
+        # keep-alive connection: retries and later calls skip the TCP+TLS handshake
         try:
-            with urllib.request.urlopen(req, timeout=timeout_s) as resp:
-                last_raw = resp.read().decode("utf-8", errors="replace")
-        except urllib.error.HTTPError as e:
-            b = ""
-            try:
-                b = e.read().decode("utf-8", errors="replace")
-            except Exception:
-                pass
-            if e.code == 429:
-                raise RuntimeError("FD_GEMINI_QUOTA_EXCEEDED: http=429 body=" + b[:1200])
-            raise RuntimeError("FD_FAIL: gemini http=" + str(e.code) + " body=" + b[:800])
+            status, _, last_raw = http_pool.request("POST", url, headers, body=body, timeout=timeout_s)
         except Exception:
-            if attempt < retries:
+            if attempt < _RETRIES:
                 time.sleep(min(2 ** (attempt - 1), 4))
                 continue
             raise
+        if status >= 400:
+            b = last_raw.decode("utf-8", errors="replace")
+            if status == 429:
+                raise RuntimeError("FD_GEMINI_QUOTA_EXCEEDED: http=429 body=" + b[:1200])
+            raise RuntimeError("FD_FAIL: gemini http=" + str(status) + " body=" + b[:800])
 
-        data = json.loads(last_raw)
+        data = json_loads(last_raw)
         cands = data.get("candidates") or []
         if isinstance(cands, list) and cands:
             c0 = cands[0]
@@ -81,6 +69,6 @@ def call_gemini(prompt: str, timeout_s: int = 900) -> str:
                 if texts:
                     return "\n".join(texts)
         # allow retry if no parts
-        if attempt < retries:
+        if attempt < _RETRIES:
             continue
-        raise RuntimeError("FD_FAIL: gemini parse raw=" + last_raw[:800])
+        raise RuntimeError("FD_FAIL: gemini parse raw=" + last_raw[:800].decode("utf-8", errors="replace"))
@@ -1,20 +1,134 @@
-import json
-import os
-import urllib.request
-from typing import Any, Dict, List
+import functools
+import http.client
+import random
+import time
+import urllib.parse
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from src.fd_auto import http_pool
+from src.fd_auto.util import env, env_int, json_dumps, json_loads
+
+# FD_HTTP_RETRIES is the number of retries after the first attempt.
+_HTTP_RETRIES = env_int("FD_HTTP_RETRIES", 3)
+_HTTP_MAX_DELAY_S = env_int("FD_HTTP_MAX_DELAY_S", 30)
+_RETRY_5XX = frozenset((500, 502, 503, 504))
+_REDIRECTS = frozenset((301, 302, 307, 308))
+_MAX_REDIRECTS = 5
+
+# (url, token) -> (etag, parsed body) for revalidated GETs; a 304 reuses the body and
+# does not count against the primary rate limit. Cached bodies are shared: do not mutate.
+_ETAG_CACHE: Dict[Tuple[str, str], Tuple[str, Any]] = {}
 
 def _repo() -> str:
-    r = (os.environ.get("GITHUB_REPOSITORY") or "").strip()
+    r = env("GITHUB_REPOSITORY")
     if r == "":
         raise RuntimeError("FD_FAIL: missing GITHUB_REPOSITORY")
     return r
 
-def _headers(token: str) -> Dict[str, str]:
-    return {
+@functools.lru_cache(maxsize=4)
+def _headers(token: str) -> Mapping[str, str]:
+    # cached per token; read-only so callers copy before adding headers
+    return MappingProxyType({
         "Authorization": "Bearer " + token,
         "Accept": "application/vnd.github+json",
         "User-Agent": "fd-auto",
-    }
+    })
+
+@functools.lru_cache(maxsize=4)
+def _post_headers(token: str) -> Mapping[str, str]:
+    h = dict(_headers(token))
+    h["content-type"] = "application/json; charset=utf-8"
+    return MappingProxyType(h)
+
+def _should_retry(method: str, status: int, data: bytes) -> bool:
+    # Rate limits mean the request was not processed, so any method may retry.
+    # 5xx is only retried for GET: a POST may already have taken effect.
+    if status == 429:
+        return True
+    if status == 403 and b"secondary rate limit" in data.lower():
+        return True
+    return method == "GET" and status in _RETRY_5XX
+
+def _retry_delay(attempt: int, headers: Optional[http.client.HTTPMessage]) -> float:
+    if headers is not None:
+        ra = (headers.get("Retry-After") or "").strip()
+        if ra.isdigit():
+            return min(float(ra), _HTTP_MAX_DELAY_S)
+        if (headers.get("X-RateLimit-Remaining") or "").strip() == "0":
+            reset = (headers.get("X-RateLimit-Reset") or "").strip()
+            if reset.isdigit():
+                return min(max(0.0, int(reset) - time.time()), _HTTP_MAX_DELAY_S)
+    # full jitter so concurrent runs do not retry in lockstep
+    return random.uniform(0, min(_HTTP_MAX_DELAY_S, 2 ** attempt))
+
+def _request(method: str, url: str, headers: Mapping[str, str], body: Optional[bytes] = None, timeout: float = 60) -> Tuple[int, http.client.HTTPMessage, bytes]:
+    attempt = 0
+    while True:
+        try:
+            status, resp_headers, data = http_pool.request(method, url, headers, body=body, timeout=timeout)
+        except (OSError, http.client.HTTPException):
+            if method != "GET" or attempt >= _HTTP_RETRIES:
+                raise
+            time.sleep(_retry_delay(attempt, None))
+            attempt += 1
+            continue
+        if attempt < _HTTP_RETRIES and _should_retry(method, status, data):
+            time.sleep(_retry_delay(attempt, resp_headers))
+            attempt += 1
+            continue
+        return status, resp_headers, data
+
+def _same_origin(a: str, b: str) -> bool:
+    ua = urllib.parse.urlsplit(a)
+    ub = urllib.parse.urlsplit(b)
+    return (ua.scheme, ua.netloc) == (ub.scheme, ub.netloc)
+
+def _get_json_conditional(url: str, token: str, etag: str = "") -> Tuple[Any, http.client.HTTPMessage]:
+    # Returns (None, headers) on 304 so pollers can skip the parse entirely.
+    headers = _headers(token)
+    if etag:
+        headers = dict(headers)
+        headers["If-None-Match"] = etag
+    # http.client does not follow redirects: follow same-origin moves (e.g. after a repo
+    # rename) and fail loudly on anything else that is not a 2xx or 304
+    target = url
+    for _ in range(_MAX_REDIRECTS + 1):
+        status, resp_headers, data = _request("GET", target, headers)
+        if status not in _REDIRECTS:
+            break
+        loc = urllib.parse.urljoin(target, resp_headers.get("Location") or "")
+        if not _same_origin(target, loc):
+            break
+        target = loc
+    if status == 304:
+        return None, resp_headers
+    if status >= 300:
+        body = data.decode("utf-8", errors="replace")
+        raise RuntimeError("FD_GH_HTTP_ERROR method=GET url=" + url + " status=" + str(status) + " body=" + body)
+    return json_loads(data), resp_headers
+
+def _get_json(url: str, token: str) -> Any:
+    return _get_json_conditional(url, token)[0]
+
+def _post_json(url: str, token: str, payload: Dict[str, Any]) -> None:
+    body = json_dumps(payload)
+    status, _, data = _request("POST", url, _post_headers(token), body=body)
+    # a 3xx is never followed for POST and means the write did not happen
+    if status >= 300:
+        eb = data.decode("utf-8", errors="replace")
+        raise RuntimeError("FD_GH_HTTP_ERROR method=POST url=" + url + " status=" + str(status) + " body=" + eb)
+
+def _get_json_cached(url: str, token: str) -> Any:
+    key = (url, token)
+    hit = _ETAG_CACHE.get(key)
+    data, headers = _get_json_conditional(url, token, hit[0] if hit else "")
+    if data is None and hit is not None:
+        return hit[1]
+    etag = headers.get("ETag") or ""
+    if etag:
+        _ETAG_CACHE[key] = (etag, data)
+    return data
 
 def safe_get(d: Any, key: str, default: Any = "") -> Any:
     if isinstance(d, dict) and key in d:
@@ -24,28 +138,19 @@ def safe_get(d: Any, key: str, default: Any = "") -> Any:
 def get_issue(issue_number: int, token: str) -> Dict[str, Any]:
     repo = _repo()
     url = f"https://api.github.com/repos/{repo}/issues/{issue_number}"
-    req = urllib.request.Request(url, headers=_headers(token), method="GET")
-    with urllib.request.urlopen(req, timeout=60) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    return _get_json_cached(url, token)
 
 def create_comment(issue_number: int, body: str, token: str) -> None:
     repo = _repo()
     url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
-    payload = json.dumps({"body": body}).encode("utf-8")
-    req = urllib.request.Request(url, headers=_headers(token), data=payload, method="POST")
-    with urllib.request.urlopen(req, timeout=60):
-        pass
+    _post_json(url, token, {"body": body})
 
 def list_issues(token: str, state: str = "open") -> List[Dict[str, Any]]:
     repo = _repo()
     url = f"https://api.github.com/repos/{repo}/issues?state={state}&per_page=100"
-    req = urllib.request.Request(url, headers=_headers(token), method="GET")
-    with urllib.request.urlopen(req, timeout=60) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    return _get_json_cached(url, token)
 
 def list_comments(issue_number: int, token: str) -> List[Dict[str, Any]]:
     repo = _repo()
     url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments?per_page=100"
-    req = urllib.request.Request(url, headers=_headers(token), method="GET")
-    with urllib.request.urlopen(req, timeout=60) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    return _get_json_cached(url, token)
@@ -0,0 +1,65 @@
+import gzip
+import http.client
+import threading
+import urllib.parse
+from typing import Dict, Optional, Tuple
+
+# One keep-alive connection per (scheme, host) per thread; http.client
+# connections are not safe to share across threads.
+_LOCAL = threading.local()
+
+def _conns() -> Dict[Tuple[str, str], http.client.HTTPConnection]:
+    c = getattr(_LOCAL, "conns", None)
+    if c is None:
+        c = {}
+        _LOCAL.conns = c
+    return c
+
+def _drop(key: Tuple[str, str]) -> None:
+    c = _conns().pop(key, None)
+    if c is not None:
+        c.close()
+
+def _get_conn(key: Tuple[str, str], timeout: float) -> http.client.HTTPConnection:
+    conns = _conns()
+    c = conns.get(key)
+    if c is None:
+        scheme, host = key
+        if scheme == "https":
+            c = http.client.HTTPSConnection(host, timeout=timeout)
+        else:
+            c = http.client.HTTPConnection(host, timeout=timeout)
+        conns[key] = c
+    c.timeout = timeout
+    if c.sock is not None:
+        c.sock.settimeout(timeout)
+    return c
+
+def request(method: str, url: str, headers: Dict[str, str], body: Optional[bytes] = None, timeout: float = 60) -> Tuple[int, http.client.HTTPMessage, bytes]:
+    u = urllib.parse.urlsplit(url)
+    key = (u.scheme, u.netloc)
+    path = (u.path or "/") + ("?" + u.query if u.query else "")
+    if "Accept-Encoding" not in headers:
+        headers = dict(headers)
+        headers["Accept-Encoding"] = "gzip"
+    while True:
+        c = _get_conn(key, timeout)
+        reused = c.sock is not None
+        try:
+            c.request(method, path, body=body, headers=headers)
+            resp = c.getresponse()
+            data = resp.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            _drop(key)
+            # the server closed an idle keep-alive socket; retry once on a fresh one
+            if reused:
+                continue
+            raise
+        except Exception:
+            _drop(key)
+            raise
+        if resp.will_close:
+            _drop(key)
+        if (resp.headers.get("Content-Encoding") or "").lower() == "gzip":
+            data = gzip.decompress(data)
+        return resp.status, resp.headers, data
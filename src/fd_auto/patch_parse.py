@@ -1,13 +1,16 @@
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 from dataclasses import dataclass
 import re
+import sys
 
-@dataclass
+from src.fd_auto.util import normalize_newlines
+
+@dataclass(slots=True)
 class FileEntry:
     path: str
     content: str
 
-@dataclass
+@dataclass(slots=True)
 class Patch:
     kind: str  # patch | bundle
     work_item_id: str
@@ -15,6 +18,18 @@ class Patch:
     files: List[FileEntry]
     delete: List[str]
 
+# A line that is ">>>" once stripped (same whitespace set as str.strip, minus newline).
+_CLOSE_RE = re.compile(r"^[^\S\n]*>>>[^\S\n]*$", re.M)
+_END_LINE_RE = re.compile(r"^[^\S\n]*END[^\S\n]*$", re.M)
+# Group 1 is a non-blank line with surrounding whitespace stripped.
+_NONBLANK_LINE_RE = re.compile(r"^[^\S\n]*(\S[^\n]*?)[^\S\n]*$", re.M)
+
+# Relaxed markdown parser: "## handoff/x.md" section headings and "path: ..." frontmatter.
+# Matched against the raw line: the outer \s* stand in for strip(), so lines that
+# do not start with "#" after indentation fail on their first character.
+_HEADING_RE = re.compile(r"^\s*(#{1,3})\s+([A-Za-z0-9_./-]+)\s*$")
+_PATH_RE = re.compile(r"^path:\s*(\S+)\s*$")
+
 def _fail(msg: str) -> None:
     raise ValueError("FD_PARSE_FAIL: " + msg)
 
@@ -24,7 +39,8 @@ def _try_parse_relaxed_markdown(t: str) -> Patch:
     # Defaults:
     # - work_item_id: WI-000 if absent
     # - producer_role: PM if absent
-    lines = (t or "").replace("\r\n","\n").replace("\r","\n").split("\n")
+    # t is already newline-normalized by parse_fd_patch_v1
+    lines = (t or "").split("\n")
 
     meta = {}
     for i in range(1, min(len(lines), 60)):
@@ -40,32 +56,34 @@ def _try_parse_relaxed_markdown(t: str) -> Patch:
             if k and v and k not in meta:
                 meta[k] = v
 
-    wi = (meta.get("work_item_id") or "WI-000").strip()
-    prod = (meta.get("producer_role") or "PM").strip()
+    # interned: every part of a bundle repeats the same ids
+    wi = sys.intern((meta.get("work_item_id") or "WI-000").strip())
+    prod = sys.intern((meta.get("producer_role") or "PM").strip())
 
     files: List[FileEntry] = []
 
     # Strategy A: frontmatter blocks
+    path_match = _PATH_RE.match
     i = 0
     while i < len(lines):
-        if lines[i].strip() == "---":
+        # the substring test skips strip() on lines that cannot be a rule
+        if "---" in lines[i] and lines[i].strip() == "---":
             j = i + 1
             path = ""
             while j < len(lines) and lines[j].strip() != "---":
-                m = re.match(r"^path:\s*(\S+)\s*$", lines[j].strip())
+                m = path_match(lines[j].strip())
                 if m:
                     path = m.group(1).strip()
                 j += 1
             if path and j < len(lines) and lines[j].strip() == "---":
                 k = j + 1
-                buf = []
                 while k < len(lines):
-                    if lines[k].strip() == "---" and k + 1 < len(lines) and re.match(r"^path:\s*\S+\s*$", lines[k+1].strip()):
+                    if "---" in lines[k] and lines[k].strip() == "---" and k + 1 < len(lines) and path_match(lines[k+1].strip()):
                         break
-                    buf.append(lines[k])
                     k += 1
                 if path.startswith("handoff/"):
-                    files.append(FileEntry(path=path, content="\n".join(buf).rstrip("\n") + "\n"))
+                    # body is lines[j+1:k]; one join instead of a per-line buffer
+                    files.append(FileEntry(path=path, content="\n".join(lines[j + 1:k]).rstrip("\n") + "\n"))
                 i = k
                 continue
         i += 1
@@ -74,112 +92,122 @@ def _try_parse_relaxed_markdown(t: str) -> Patch:
         return Patch(kind="patch", work_item_id=wi, producer_role=prod, files=files, delete=[])
 
     # Strategy B: heading sections
-    heading_re = re.compile(r"^(#{1,3})\s+([A-Za-z0-9_./-]+)\s*$")
+    heading_match = _HEADING_RE.match
     current_path = None
-    buf: List[str] = []
+    start = 0
 
-    def commit() -> None:
-        nonlocal current_path, buf, files
+    def commit(end: int) -> None:
+        # the section body is lines[start:end]
         if current_path and current_path.startswith("handoff/"):
-            files.append(FileEntry(path=current_path, content="\n".join(buf).rstrip("\n") + "\n"))
-        current_path = None
-        buf = []
+            files.append(FileEntry(path=current_path, content="\n".join(lines[start:end]).rstrip("\n") + "\n"))
 
-    for raw in lines:
-        m = heading_re.match(raw.strip())
+    for idx, raw in enumerate(lines):
+        m = heading_match(raw)
         if m:
             path = m.group(2).strip()
             if path.startswith("handoff/") and path.endswith(".md"):
-                commit()
+                commit(idx)
                 current_path = path
-                continue
-        buf.append(raw)
+                start = idx + 1
 
-    commit()
+    commit(len(lines))
 
     if not files:
         _fail("no FILE blocks (relaxed markdown parse found no sections)")
     return Patch(kind="patch", work_item_id=wi, producer_role=prod, files=files, delete=[])
 
+def _line_end(t: str, pos: int) -> int:
+    e = t.find("\n", pos)
+    return len(t) if e < 0 else e
+
 def parse_fd_patch_v1(text: str) -> Patch:
-    t = (text or "").replace("\r\n","\n").replace("\r","\n").strip()
+    return _parse_normalized(normalize_newlines(text or ""))
+
+def _parse_normalized(t: str) -> Patch:
+    # t must already be LF-only
+    t = t.strip()
     if not t.startswith("FD_PATCH_V1"):
         _fail("missing FD_PATCH_V1 header")
-    lines = t.split("\n")
+    return _parse_body(t, _line_end(t, 0) + 1)
+
+def _parse_body(t: str, start: int) -> Patch:
+    # Parses everything after the header line of a stripped, LF-only text. start is
+    # where the body begins, so bundle parts are parsed in place under their own
+    # FD_BUNDLE_V1 header without being rebuilt as an FD_PATCH_V1 string.
+    n = len(t)
     meta = {}
     files: List[FileEntry] = []
     delete: List[str] = []
-    i = 1
-    while i < len(lines):
-        line = lines[i]
-        if line.startswith("FILE:") or line.strip() in ("DELETE:", "END"):
+    # pos always points at the start of a line; pos > n means end of input
+    pos = start
+    while pos <= n:
+        eol = _line_end(t, pos)
+        line = t[pos:eol]
+        s = line.strip()
+        if line.startswith("FILE:") or s in ("DELETE:", "END"):
             break
-        if line.strip() == "":
-            i += 1
+        pos = eol + 1
+        if s == "":
             continue
         if ":" not in line:
             _fail("bad meta line: " + line[:120])
         k, v = line.split(":", 1)
         meta[k.strip()] = v.strip()
-        i += 1
 
-    def parse_file(j: int) -> Tuple[int, FileEntry]:
-        header = lines[j]
+    def parse_file(j: int, header: str) -> Tuple[int, FileEntry]:
         path = header[len("FILE:"):].strip()
         if path == "":
             _fail("empty FILE path")
-        if j + 1 >= len(lines) or lines[j+1].strip() != "<<<":
+        open_at = _line_end(t, j) + 1
+        if open_at > n or t[open_at:_line_end(t, open_at)].strip() != "<<<":
             _fail("FILE missing <<< for path=" + path)
-        k = j + 2
-        buf = []
-        while k < len(lines):
-            if lines[k].strip() == ">>>":
-                break
-            buf.append(lines[k])
-            k += 1
-        if k >= len(lines):
+        body_start = _line_end(t, open_at) + 1
+        m = _CLOSE_RE.search(t, body_start) if body_start <= n else None
+        if m is None:
             _fail("FILE missing >>> for path=" + path)
-        return k + 1, FileEntry(path=path, content="\n".join(buf) + "\n")
+        return m.end() + 1, FileEntry(path=path, content=t[body_start:m.start()] or "\n")
 
-    while i < len(lines):
-        line = lines[i].strip()
+    while pos <= n:
+        eol = _line_end(t, pos)
+        line = t[pos:eol].strip()
         if line == "":
-            i += 1
+            pos = eol + 1
             continue
         if line.startswith("FILE:"):
-            i, fe = parse_file(i)
+            pos, fe = parse_file(pos, t[pos:eol])
             files.append(fe)
             continue
         if line == "DELETE:":
-            i += 1
-            while i < len(lines):
-                l = lines[i].strip()
-                if l == "":
-                    i += 1
-                    continue
-                if l == "END":
-                    break
+            # the section runs to the END line (or end of input); blank lines are
+            # skipped by the item regex, every other line must be a "- path" item
+            m_end = _END_LINE_RE.search(t, eol + 1)
+            stop = m_end.start() if m_end else n
+            for m in _NONBLANK_LINE_RE.finditer(t, eol + 1, stop):
+                l = m.group(1)
                 if l.startswith("-"):
                     delete.append(l[1:].strip())
                 else:
                     _fail("bad DELETE line: " + l[:120])
-                i += 1
+            pos = stop if m_end else n + 1
             continue
         if line == "END":
             break
         _fail("unexpected line: " + line[:120])
 
-    wi = meta.get("work_item_id","").strip()
-    prod = meta.get("producer_role","").strip()
+    wi = sys.intern(meta.get("work_item_id","").strip())
+    prod = sys.intern(meta.get("producer_role","").strip())
     if wi == "" or prod == "" or not files:
-        return _try_parse_relaxed_markdown(t)
+        hdr_end = _line_end(t, 0) + 1
+        # the relaxed parser skips line 0, so only body lines need to line up
+        return _try_parse_relaxed_markdown(t if start == hdr_end else t[:hdr_end] + t[start:])
     return Patch(kind="patch", work_item_id=wi, producer_role=prod, files=files, delete=delete)
 
 def bundle_total_parts(raw: str) -> Tuple[int, int]:
-    t = (raw or "").strip()
+    # only the header line matters: no full-text strip or splitlines
+    t = (raw or "").lstrip()
     if not t.startswith("FD_BUNDLE_V1"):
         return (1,1)
-    first = t.splitlines()[0].strip()
+    first = t[:_line_end(t, 0)].splitlines()[0].strip()
     if "PART" not in first:
         return (1,1)
     toks = first.split()
@@ -194,30 +222,32 @@ def bundle_total_parts(raw: str) -> Tuple[int, int]:
     except Exception:
         return (1,1)
 
-def _strip_bundle_header(raw: str) -> str:
-    t = (raw or "").replace("\r\n","\n").replace("\r","\n").strip()
+_LEADING_WS_RE = re.compile(r"\s*")
+
+def _bundle_body(raw: str) -> Tuple[str, int]:
+    # Returns the normalized part and the offset of its first non-blank body character.
+    t = normalize_newlines(raw or "").strip()
     if not t.startswith("FD_BUNDLE_V1"):
         _fail("bundle missing header")
-    lines = t.split("\n")
-    return "\n".join(lines[1:]).lstrip()
+    start = _line_end(t, 0) + 1
+    if start < len(t):
+        start = _LEADING_WS_RE.match(t, start).end()
+    return t, start
 
 def parse_bundle_parts(parts: List[str]) -> Patch:
     if not parts:
         _fail("no parts")
     base: Patch | None = None
-    seen = {}
-    order: List[str] = []
+    # dict keeps first-seen path order; later parts overwrite earlier content
+    seen: Dict[str, FileEntry] = {}
     delete: List[str] = []
     for raw in parts:
-        patch_text = "FD_PATCH_V1\n" + _strip_bundle_header(raw)
-        p = parse_fd_patch_v1(patch_text)
+        p = _parse_body(*_bundle_body(raw))
         if base is None:
             base = p
         delete.extend(p.delete)
         for fe in p.files:
-            if fe.path not in order:
-                order.append(fe.path)
             seen[fe.path] = fe
     assert base is not None
-    merged = [seen[p] for p in order]
-    return Patch(kind="bundle", work_item_id=base.work_item_id, producer_role=base.producer_role, files=merged, delete=delete)
+    merged = list(seen.values())
+    return Patch(kind="bundle", work_item_id=base.work_item_id, producer_role=base.producer_role, files=merged, delete=list(dict.fromkeys(delete)))
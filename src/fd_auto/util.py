@@ -1,11 +1,60 @@
+import functools
+import json
 import os
 import re
-from typing import Dict, Tuple
+from typing import Any, Dict
 
-def env(name: str, default: str = "") -> str:
+try:
+    import orjson
+except ImportError:  # optional accelerator; stdlib json is the fallback
+    orjson = None
+
+_CRLF_RE = re.compile(r"\r\n?")
+_SLUG_NON = re.compile(r"[^a-z0-9]+")
+_SLUG_DASH = re.compile(r"-+")
+_TASK_RE = re.compile(r"^[0-9]+(\.[0-9]+)*$")
+# Line breaks str.splitlines() honors beyond \n and \r\n.
+_ODD_LINEBREAK_RE = re.compile("\r(?!\n)|[\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+def json_loads(data: bytes) -> Any:
+    # orjson parses UTF-8 bytes directly, skipping the str decode
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+def json_dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+def normalize_newlines(t: str) -> str:
+    # LF-only text (the common case) is returned as-is without a copy
+    if "\r" not in t:
+        return t
+    # CRLF and lone CR to LF in one pass
+    return _CRLF_RE.sub("\n", t)
+
+@functools.lru_cache(maxsize=None)
+def _env_cached(name: str, default: str) -> str:
     v = os.environ.get(name, default)
     return (v or "").strip()
 
+def env(name: str, default: str = "") -> str:
+    # process env is fixed for a tool run; call clear_env_cache() after changing os.environ
+    return _env_cached(name, default)
+
+def clear_env_cache() -> None:
+    _env_cached.cache_clear()
+
+def env_int(name: str, default: int) -> int:
+    v = env(name)
+    if v == "":
+        return default
+    try:
+        return int(v)
+    except Exception:
+        return default
+
 def require_env(name: str) -> str:
     v = env(name)
     if v == "":
@@ -13,27 +62,50 @@ def require_env(name: str) -> str:
     return v
 
 def extract_field(text: str, key: str) -> str:
-    for line in (text or "").splitlines():
-        if line.startswith(key + ":"):
+    t = text or ""
+    key_c = key + ":"
+    # no occurrence anywhere means no matching line; skip the split
+    if key_c not in t:
+        return ""
+    if _ODD_LINEBREAK_RE.search(t) is None:
+        # only \n / \r\n breaks: find the first line starting with key_c directly
+        if t.startswith(key_c):
+            i = 0
+        else:
+            i = t.find("\n" + key_c)
+            if i < 0:
+                return ""
+            i += 1
+        end = t.find("\n", i)
+        line = t[i:end] if end >= 0 else t[i:]
+        return line.split(":", 1)[1].strip()
+    for line in t.splitlines():
+        if line.startswith(key_c):
             return line.split(":", 1)[1].strip()
     return ""
 
 def slugify(s: str) -> str:
     t = (s or "").lower().strip()
-    t = re.sub(r"[^a-z0-9]+", "-", t)
-    t = re.sub(r"-+", "-", t).strip("-")
+    t = _SLUG_NON.sub("-", t)
+    t = _SLUG_DASH.sub("-", t).strip("-")
     if t == "":
         return "app"
     return t[:40]
 
-def task_key(s: str) -> Tuple[int, int, int, int, int, int, int, int]:
+_TASK_LANE_BITS = 32
+_TASK_LANE_MAX = (1 << _TASK_LANE_BITS) - 1
+
+def task_key(s: str) -> int:
+    # Sort key for dotted task numbers: 8 components (missing ones = 9999, as is
+    # every component of an invalid key) packed most-significant-first into 32-bit
+    # lanes, so keys compare with one int compare instead of an 8-tuple walk.
     t = (s or "").strip()
-    if not re.match(r"^[0-9]+(\.[0-9]+)*$", t):
-        return (9999, 9999, 9999, 9999, 9999, 9999, 9999, 9999)
-    parts = [int(x) for x in t.split(".")]
-    pad = 8
-    parts = parts[:pad] + [9999] * max(0, pad - len(parts))
-    return tuple(parts)
+    parts = [int(x) for x in t.split(".")[:8]] if _TASK_RE.match(t) else []
+    parts += [9999] * (8 - len(parts))
+    k = 0
+    for p in parts:
+        k = (k << _TASK_LANE_BITS) | min(p, _TASK_LANE_MAX)
+    return k
 
 def first_n_lines(s: str, n: int) -> str:
     return "\n".join((s or "").splitlines()[:n])
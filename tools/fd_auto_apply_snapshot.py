@@ -1,49 +1,62 @@
 #!/usr/bin/env python3
 import os
+import re
 from pathlib import Path
 
 TEXT_EXT = {".py",".md",".yml",".yaml",".json",".txt",".html",".css",".js",".ts",".csv"}
 
+_FILE_LINE_RE = re.compile(r"^FILE:(.*)$", re.M)
+# a close line is any line that strips to ">>>"; [^\S\n] keeps the match on one line
+_CLOSE_LINE_RE = re.compile(r"^[^\S\n]*>>>[^\S\n]*$", re.M)
+
 def _fail(msg: str) -> None:
     raise RuntimeError("FD_FAIL: " + msg)
 
 def _is_text_path(rel: str) -> bool:
-    return Path(rel).suffix.lower() in TEXT_EXT
+    # splitext + set lookup; avoids building a Path object per snapshot entry
+    return os.path.splitext(rel)[1].lower() in TEXT_EXT
+
+def _line_end(t: str, pos: int) -> int:
+    e = t.find("\n", pos)
+    return len(t) if e < 0 else e
 
 def apply_snapshot(snapshot_text: str, repo_root: Path) -> None:
     t = (snapshot_text or "").replace("\r\n","\n").replace("\r","\n")
     if not t.strip().startswith("FD_APP_SOURCE_V1"):
         _fail("snapshot missing header")
-    lines = t.split("\n")
-    i = 0
-    # skip header/meta until first FILE:
-    while i < len(lines) and not lines[i].startswith("FILE:"):
-        i += 1
-    while i < len(lines):
-        line = lines[i]
-        if not line.startswith("FILE:"):
-            i += 1
-            continue
-        rel = line.split(":",1)[1].strip()
+    # offset scan over the one string: FILE:/>>> lines are located by regex, bodies are
+    # sliced out whole, so no per-line list is built
+    pos = 0
+    made_dirs = set()
+    while True:
+        m = _FILE_LINE_RE.search(t, pos)
+        if m is None:
+            break
+        rel = m.group(1).strip()
         if rel == "":
             _fail("empty FILE path")
-        if i+1 >= len(lines) or lines[i+1].strip() != "<<<":
+        if m.end() >= len(t):
             _fail("missing <<< for " + rel)
-        j = i + 2
-        buf = []
-        while j < len(lines):
-            if lines[j].strip() == ">>>":
-                break
-            buf.append(lines[j])
-            j += 1
-        if j >= len(lines):
+        open_end = _line_end(t, m.end() + 1)
+        if t[m.end() + 1:open_end].strip() != "<<<":
+            _fail("missing <<< for " + rel)
+        if open_end >= len(t):
+            _fail("missing >>> for " + rel)
+        body_start = open_end + 1
+        c = _CLOSE_LINE_RE.search(t, body_start)
+        if c is None:
             _fail("missing >>> for " + rel)
-        i = j + 1
+        pos = c.end() + 1
         if not _is_text_path(rel):
             continue
+        body = t[body_start:c.start() - 1] if c.start() > body_start else ""
         out_path = repo_root / rel
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        out_path.write_text("\n".join(buf) + "\n", encoding="utf-8")
+        # most entries share a handful of directories; mkdir each one once
+        parent = out_path.parent
+        if parent not in made_dirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            made_dirs.add(parent)
+        out_path.write_bytes((body + "\n").encode("utf-8"))
 
 def main() -> int:
     import sys
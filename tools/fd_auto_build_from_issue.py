@@ -6,39 +6,79 @@ import os
 import shutil
 import subprocess
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 sys.path.insert(0, os.path.abspath(os.getcwd()))
 
 from src.fd_auto.github_api import get_issue, create_comment
-from src.fd_auto.util import require_env, extract_field, slugify
+from src.fd_auto.util import env_int, require_env, extract_field, slugify
 from src.fd_auto.gemini_client import call_gemini
-from src.fd_auto.patch_parse import parse_fd_patch_v1, parse_bundle_parts, bundle_total_parts
+from src.fd_auto.gemini_cache import cached_call
+from src.fd_auto.patch_parse import Patch, parse_fd_patch_v1, parse_bundle_parts, bundle_total_parts
 from src.fd_auto.apply_patch import apply_patch
+# sibling script (tools/ is sys.path[0] when run as a script); imported so snapshots
+# run in-process instead of paying a second interpreter start each time
+import fd_auto_make_snapshot
 
 def _write(path: Path, s: str) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(s, encoding="utf-8", errors="ignore")
 
+def _read_guide(path: str, default: str = "") -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except FileNotFoundError:
+        return default
+
+def _make_snapshot() -> None:
+    # snapshots the cwd; a non-zero return is fatal, as a failed child process would be
+    rc = fd_auto_make_snapshot.main()
+    if rc != 0:
+        raise RuntimeError("FD_FAIL: make_snapshot rc=" + str(rc))
+
+# Caps in-flight Gemini requests across the concurrent bundles and their continuation
+# parts (up to 3 x 8 otherwise); call_gemini fails the build on the first 429.
+_GEMINI_SLOTS = threading.BoundedSemaphore(max(1, env_int("FD_GEMINI_MAX_CONCURRENCY", 4)))
+
+def _bundle_call(prompt: str) -> str:
+    with _GEMINI_SLOTS:
+        return cached_call(prompt, timeout_s=900)
+
 def _call_bundle(prompt: str, out_dir: Path) -> list[str]:
     parts = []
-    first = call_gemini(prompt, timeout_s=900)
+    first = _bundle_call(prompt)
     parts.append(first)
     _write(out_dir / "part_1.txt", first)
     x, y = bundle_total_parts(first)
     if y <= 1:
         return parts
-    cur = x
     # hard cap; user can tune later
-    while cur < y and cur < 8:
-        cur += 1
+    rest = list(range(x + 1, min(y, 8) + 1))
+
+    def _part(cur: int) -> str:
         cont = prompt + "\n\nCONTINUE\nReturn ONLY: FD_BUNDLE_V1 PART " + str(cur) + "/" + str(y) + "\nDo not repeat earlier parts.\n"
-        nxt = call_gemini(cont, timeout_s=900)
-        parts.append(nxt)
+        nxt = _bundle_call(cont)
         _write(out_dir / ("part_" + str(cur) + ".txt"), nxt)
+        return nxt
+
+    # each continuation prompt only names its part index, so once part 1 reports Y the
+    # rest are fetched concurrently; map keeps them in part order
+    if rest:
+        with ThreadPoolExecutor(max_workers=len(rest)) as ex:
+            parts.extend(ex.map(_part, rest))
     _write(out_dir / "bundle_full.txt", "\n\n".join(parts))
     return parts
 
+def _gen_bundle(name: str, prompt: str, artifacts: Path) -> Patch:
+    # artifacts/<name>_prompt.txt and artifacts/<name>_bundle/ are private to this bundle,
+    # so concurrent calls never write the same file
+    _write(artifacts / (name + "_prompt.txt"), prompt)
+    parts = _call_bundle(prompt, artifacts / (name + "_bundle"))
+    return parse_bundle_parts(parts)
+
 def main() -> int:
     import sys
     if len(sys.argv) < 2:
@@ -60,10 +100,10 @@ def main() -> int:
 
         artifacts = Path(tempfile.mkdtemp(prefix="fd_build_artifacts_"))
         _write(artifacts / "milestone_issue.txt", body)
-        subprocess.check_call(["python3","tools/fd_auto_make_snapshot.py"], cwd=repo_root)
+        _make_snapshot()
 
         # 1) Plan (PM): FD_PATCH_V1 handoff-only
-        pm_prompt = open("agent_guides/ROLE_PM.txt","r",encoding="utf-8",errors="ignore").read() if os.path.exists("agent_guides/ROLE_PM.txt") else "ROLE: PM\nOutput FD_PATCH_V1 with handoff files only.\n"
+        pm_prompt = _read_guide("agent_guides/ROLE_PM.txt", "ROLE: PM\nOutput FD_PATCH_V1 with handoff files only.\n")
         plan_prompt = pm_prompt + "\n\nMILESTONE_TITLE\n" + title + "\n\nMILESTONE_BODY\n" + body + "\n"
         _write(artifacts / "plan_prompt.txt", plan_prompt)
 
@@ -80,20 +120,12 @@ def main() -> int:
                 last_err = str(exc)
                 err_msg = "FD_WARN: plan_parse_failed attempt=" + str(attempt) + " err=" + last_err
                 print(err_msg)
-                _write(artifacts / ("plan_parse_error_attempt_" + str(attempt) + ".txt"), err_msg + "
-
-OUTPUT_PREVIEW
-" + (plan_out[:2000] if plan_out else "") + "
-")
+                _write(artifacts / ("plan_parse_error_attempt_" + str(attempt) + ".txt"), err_msg + "\n\nOUTPUT_PREVIEW\n" + (plan_out[:2000] if plan_out else "") + "\n")
                 continue
         if patch is None:
             fail_msg = "FD_FAIL: plan_parse_failed err=" + last_err
             print(fail_msg)
-            _write(artifacts / "plan_parse_error.txt", fail_msg + "
-
-LAST_OUTPUT_PREVIEW
-" + (plan_out[:4000] if plan_out else "") + "
-")
+            _write(artifacts / "plan_parse_error.txt", fail_msg + "\n\nLAST_OUTPUT_PREVIEW\n" + (plan_out[:4000] if plan_out else "") + "\n")
             try:
                 create_comment(issue_number, fail_msg, token)
             except Exception:
@@ -103,43 +135,38 @@ LAST_OUTPUT_PREVIEW
         # Apply plan into repo (handoff)
         apply_patch(patch, repo_root)
 
-        # 2) Code bundle
+        # 2-4) Code, docs and tests bundles. The prompts depend only on the plan, so the
+        # three Gemini round trips run concurrently; patches are applied in a fixed order.
         plan_text = ""
         plan_path = Path(repo_root) / "handoff" / "app_building_plan.md"
         if plan_path.exists():
             plan_text = plan_path.read_text(encoding="utf-8", errors="ignore")
-        code_prompt = open("agent_guides/ROLE_BUILDER.txt","r",encoding="utf-8",errors="ignore").read() if os.path.exists("agent_guides/ROLE_BUILDER.txt") else ""
+        # one read of the builder guide shared by the code/docs/tests prompts
+        builder_guide = _read_guide("agent_guides/ROLE_BUILDER.txt")
+        code_prompt = builder_guide
         code_prompt += "\n\nTASK\nGenerate FULL APPLICATION CODE ONLY.\n"
         code_prompt += "\n\nAPP_BUILDING_PLAN\n" + plan_text + "\n"
         code_prompt += "\nRULES\n- Output FD_BUNDLE_V1 PART 1/Y\n- Close every FILE block with >>>\n"
-        _write(artifacts / "code_prompt.txt", code_prompt)
-        code_parts = _call_bundle(code_prompt, artifacts / "code_bundle")
-        code_patch = parse_bundle_parts(code_parts)
-        apply_patch(code_patch, repo_root)
 
-        # 3) Docs bundle
-        docs_prompt = open("agent_guides/ROLE_BUILDER.txt","r",encoding="utf-8",errors="ignore").read() if os.path.exists("agent_guides/ROLE_BUILDER.txt") else ""
+        docs_prompt = builder_guide
         docs_prompt += "\n\nTASK\nGenerate COMPREHENSIVE DOCUMENTATION ONLY.\n"
         docs_prompt += "- Write README.md and docs/howto.md and docs/troubleshooting.md\n"
         docs_prompt += "\n\nAPP_BUILDING_PLAN\n" + plan_text + "\n"
         docs_prompt += "\nRULES\n- Output FD_BUNDLE_V1 PART 1/Y\n- Close every FILE block with >>>\n"
-        _write(artifacts / "docs_prompt.txt", docs_prompt)
-        docs_parts = _call_bundle(docs_prompt, artifacts / "docs_bundle")
-        docs_patch = parse_bundle_parts(docs_parts)
-        apply_patch(docs_patch, repo_root)
 
-        # 4) Tests bundle
-        tests_prompt = open("agent_guides/ROLE_BUILDER.txt","r",encoding="utf-8",errors="ignore").read() if os.path.exists("agent_guides/ROLE_BUILDER.txt") else ""
+        tests_prompt = builder_guide
         tests_prompt += "\n\nTASK\nGenerate UNIT TESTS ONLY.\n"
         tests_prompt += "- Write tests/ files for src/ modules\n"
         tests_prompt += "- Ensure tests run with: python -m unittest discover -s tests\n"
         tests_prompt += "\n\nAPP_BUILDING_PLAN\n" + plan_text + "\n"
         tests_prompt += "\nRULES\n- Output FD_BUNDLE_V1 PART 1/Y\n- Close every FILE block with >>>\n"
-        _write(artifacts / "tests_prompt.txt", tests_prompt)
-        tests_parts = _call_bundle(tests_prompt, artifacts / "tests_bundle")
-        tests_patch = parse_bundle_parts(tests_parts)
-        apply_patch(tests_patch, repo_root)
-        subprocess.check_call(["python3","tools/fd_auto_make_snapshot.py"], cwd=repo_root)
+
+        bundles = [("code", code_prompt), ("docs", docs_prompt), ("tests", tests_prompt)]
+        with ThreadPoolExecutor(max_workers=len(bundles)) as ex:
+            futs = [ex.submit(_gen_bundle, name, prompt, artifacts) for name, prompt in bundles]
+            for fut in futs:
+                apply_patch(fut.result(), repo_root)
+        _make_snapshot()
 
 # 3) (Optional) docs and tests are deferred; this build flow only creates app branch from code bundle.
         # Users run Tune flow to add docs/tests using branch input and extra env keys.
@@ -5,19 +5,66 @@ from pathlib import Path
 
 TEXT_EXT = {".py",".md",".yml",".yaml",".json",".txt",".html",".css",".js",".ts",".csv"}
 
-EXCLUDE_DIRS = {".git","__pycache__",".pytest_cache","node_modules",".venv","venv","docs/_site",".github"}
+# repo-relative dir paths (not bare names): "node_modules" skips only the top-level one
+EXCLUDE_DIRS = frozenset({".git","__pycache__",".pytest_cache","node_modules",".venv","venv","docs/_site",".github"})
 
-def _is_text_file(path: Path) -> bool:
-    return path.suffix.lower() in TEXT_EXT
+_TEXT_SUFFIXES = tuple(sorted(TEXT_EXT))
 
-def _rel(p: Path, root: Path) -> str:
-    return str(p.relative_to(root)).replace("\\","/")
+def _is_text_file(name: str) -> bool:
+    # one tuple endswith on the bare name; rfind keeps Path.suffix's rule that a
+    # leading dot (".md") is not an extension
+    n = name.lower()
+    return n.endswith(_TEXT_SUFFIXES) and n.rfind(".") > 0
+
+def _normalized_utf8(data: bytes) -> bytes:
+    # File body as written to the snapshot: UTF-8 with undecodable bytes dropped, LF
+    # line ends, and always a trailing newline plus the blank line before ">>>".
+    if data.isascii():
+        # common case: newline folding on the raw bytes, no decode/encode round trip
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    else:
+        # decode first: dropping invalid bytes can bring a \r and \n together
+        t = data.decode("utf-8", errors="ignore")
+        data = t.replace("\r\n", "\n").replace("\r", "\n").encode("utf-8")
+    return data + (b"\n" if data.endswith(b"\n") else b"\n\n")
 
 def _should_skip_dir(rel: str) -> bool:
-    for x in EXCLUDE_DIRS:
-        if rel == x or rel.startswith(x + "/"):
+    # rel or any of its "/"-bounded prefixes listed: one set probe per path level
+    # instead of a startswith per excluded entry
+    i = rel.find("/")
+    while i >= 0:
+        if rel[:i] in EXCLUDE_DIRS:
             return True
-    return False
+        i = rel.find("/", i + 1)
+    return rel in EXCLUDE_DIRS
+
+def _iter_text_files(root: str):
+    # (repo-relative path, DirEntry) for snapshot candidates, in os.walk top-down
+    # order. scandir's DirEntry carries the file type from readdir, rel paths are built
+    # by concatenation, and excluded dirs are pruned before they are ever opened.
+    stack = [("", root)]
+    while stack:
+        rel_dir, path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        prefix = rel_dir + "/" if rel_dir else ""
+        subdirs = []
+        for e in entries:
+            try:
+                is_dir = e.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                rel = prefix + e.name
+                # like os.walk(followlinks=False): symlinked dirs are listed, not entered
+                if not _should_skip_dir(rel) and not e.is_symlink():
+                    subdirs.append((rel, e.path))
+            elif _is_text_file(e.name):
+                yield prefix + e.name, e
+        stack.extend(reversed(subdirs))
 
 def main() -> int:
     repo_root = Path(os.getcwd())
@@ -28,45 +75,28 @@ def main() -> int:
 
     max_file_bytes = int(os.environ.get("FD_SNAPSHOT_MAX_FILE_BYTES","600000") or "600000")
 
-    lines = []
-    lines.append("FD_APP_SOURCE_V1")
-    lines.append("timestamp_utc: " + ts)
-    lines.append("root: /")
-    lines.append("")
+    # streamed straight to the output file: no per-line list and no final join, so
+    # memory stays at one source file however large the snapshot gets
+    with open(out_path, "wb", buffering=1 << 20) as out:
+        out.write(("FD_APP_SOURCE_V1\ntimestamp_utc: " + ts + "\nroot: /\n").encode("utf-8"))
 
-    for dp, dn, fn in os.walk(repo_root):
-        rel_dir = _rel(Path(dp), repo_root)
-        if rel_dir == ".":
-            rel_dir = ""
-        if _should_skip_dir(rel_dir):
-            dn[:] = []
-            continue
-        dn[:] = [d for d in dn if not _should_skip_dir((rel_dir + "/" + d).strip("/"))]
-        for f in fn:
-            p = Path(dp) / f
-            rel = _rel(p, repo_root)
+        for rel, entry in _iter_text_files(str(repo_root)):
             if rel.startswith("docs/assets/app/app-source_"):
                 continue
-            if not _is_text_file(p):
-                continue
             try:
-                if p.stat().st_size > max_file_bytes:
+                if entry.stat().st_size > max_file_bytes:
                     continue
             except Exception:
                 continue
             try:
-                content = p.read_text(encoding="utf-8", errors="ignore")
+                with open(entry.path, "rb") as f:
+                    data = f.read()
             except Exception:
                 continue
-            lines.append("FILE: " + rel)
-            lines.append("<<<")
-            lines.extend(content.replace("\r\n","\n").replace("\r","\n").split("\n"))
-            if not content.endswith("\n"):
-                lines.append("")
-            lines.append(">>>")
-            lines.append("")
+            out.write(b"\nFILE: " + rel.encode("utf-8") + b"\n<<<\n")
+            out.write(_normalized_utf8(data))
+            out.write(b">>>\n")
 
-    out_path.write_text("\n".join(lines), encoding="utf-8")
     print("FD_OK: wrote " + str(out_path))
     return 0
 
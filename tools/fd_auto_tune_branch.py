@@ -18,22 +18,81 @@ FD_PROMPT_MAX_CTX_CHARS = int(os.environ.get('FD_PROMPT_MAX_CTX_CHARS','60000')
 FD_PROMPT_MAX_RELATED_FILES = int(os.environ.get('FD_PROMPT_MAX_RELATED_FILES','12') or '12')
 FD_PROMPT_MAX_FILE_CHARS = int(os.environ.get('FD_PROMPT_MAX_FILE_CHARS','12000') or '12000')
 FD_PROMPT_MAX_RELATED_TOTAL_CHARS = int(os.environ.get('FD_PROMPT_MAX_RELATED_TOTAL_CHARS','80000') or '80000')
+FD_SNAPSHOT_MAX_CHARS = int(os.environ.get('FD_SNAPSHOT_MAX_CHARS','180000') or '180000')
+FD_SNAPSHOT_CHUNK_CHARS = int(os.environ.get('FD_SNAPSHOT_CHUNK_CHARS','50000') or '50000')
 
 sys.path.insert(0, os.path.abspath(os.getcwd()))
 
 from src.fd_auto.actions_api import (
     dispatch_workflow,
-    download_artifact_zip,
+    download_artifact_to_file,
     download_run_logs_zip,
     extract_logs_text,
     find_latest_run_id,
     list_run_artifacts,
     wait_run_complete,
 )
-from src.fd_auto.gemini_client import call_gemini
+from src.fd_auto.gemini_cache import cached_call, store_response
+from src.fd_auto.util import normalize_newlines
+
+# Diff scanners: compiled once instead of per line of every Gemini diff.
+_DIFF_GIT_RE = re.compile(r"^diff --git a/(.+) b/(.+)\\s*$")
+_DIFF_HEADER_RE = re.compile(r"^diff --git a/(.+) b/(.+)\s*$")
+_FLIP_SECRET_RE = re.compile(r"\\$\\{\\{\\s*secrets\\.([A-Za-z0-9_]+)\\s*\\}\\}")
+_FLIP_VARS_RE = re.compile(r"\\$\\{\\{\\s*vars\\.([A-Za-z0-9_]+)\\s*\\}\\}")
+
+# Log line markers, each list folded into one alternation so a line is tested in a
+# single regex scan instead of one substring search per marker.
+_SUMMARY_MARKER_RE = re.compile("|".join(map(re.escape, [
+    "Traceback", "ERROR", "Error:", "FAILED", "FD_FAIL", "Exception",
+])))
+_FAILURE_MARKER_RE = re.compile("|".join(map(re.escape, [
+    "FD_FAIL",
+    "FD_POLICY_FAIL",
+    "Traceback",
+    "ERROR",
+    "Error:",
+    "##[error]",
+    "Process completed with exit code",
+    "Unhandled exception",
+])))
+
+# ${{ secrets.X }} / vars / env / inputs in one pass over the workflow YAML; the
+# context name is group 1 and picks the output bucket.
+_WORKFLOW_REF_RE = re.compile(r"\$\{\{\s*(secrets|vars|env|inputs)\.([A-Za-z0-9_]+)\s*\}\}")
+
+# (literal every match must contain, compiled pattern): a C-level substring test skips
+# the regex scan entirely for path families the evidence never mentions
+_EVIDENCE_PATH_RES = [
+    ("github/workflows/", re.compile(r"(\\.github/workflows/[A-Za-z0-9_./\\-]+\\.ya?ml)")),
+    ("src/", re.compile(r"(src/[A-Za-z0-9_./\\-]+\\.py)")),
+    ("tools/", re.compile(r"(tools/[A-Za-z0-9_./\\-]+\\.py)")),
+    ("fd_policy/", re.compile(r"(fd_policy/[A-Za-z0-9_./\\-]+\\.txt)")),
+    ("docs/", re.compile(r"(docs/[A-Za-z0-9_./\\-]+)")),
+]
+
+# One snapshot FILE block (make_snapshot format), up to its first ">>>" line.
+_SNAPSHOT_BLOCK_RE = re.compile(r"^FILE: (.*)\n<<<\n(?:.*\n)*?>>>$", re.M)
+
+# Static head of every fix prompt. Kept byte-identical across attempts and runs: Gemini
+# only reuses cached input tokens for a shared prompt prefix.
+_FIX_PROMPT_RULES = (
+    "You are the Builder fixing an automated GitHub Actions workflow failure.\n"
+    "\nGOAL\n"
+    "Make the target workflow run succeed on the target branch with the smallest possible code change.\n"
+    "\nHARD RULES\n"
+    "- Output ONLY a standard unified diff (git apply compatible). No markdown. No explanations.\n"
+    "- FIRST LINE MUST BE: diff --git a/FILE b/FILE\n"
+    "- Make minimal changes required by evidence. No refactors, renames, or cleanup unless required by logs.\n"
+    "- Do not change workflow triggers or secrets/vars/env names unless evidence explicitly requires it.\n"
+    "- You MAY create new files if needed, but you must include them in the unified diff (new file mode + full content).\n"
+    "- Prefer editing existing files over creating new files. Use REPO_GUIDE and RELATED_FILES to find existing code before adding new files.\n"
+    "- If this workflow is used by automation, keep it dispatchable: must include on: workflow_dispatch.\n"
+    "- Base everything on EVIDENCE below.\n"
+)
 
 def _preview(s: str, n: int = 600) -> str:
-    t = (s or "").replace("\r\n","\n").replace("\r","\n")
+    t = normalize_newlines(s or "")
     t = t.replace("\n", " ")
     if len(t) > n:
         return t[:n] + " [TRUNC]"
@@ -47,9 +106,13 @@ def _write(p: Path, s: str) -> None:
     p.write_text(s, encoding="utf-8", errors="ignore")
 
 def _read_text_if_exists(p: Path, max_chars: int = 120000) -> str:
-    if not p.exists():
+    # one open instead of exists() + open; universal newlines do the \r\n/\r folding and
+    # reading max_chars + 1 is enough to decide truncation without loading the whole file
+    try:
+        with open(p, "r", encoding="utf-8", errors="ignore") as f:
+            txt = f.read(max_chars + 1)
+    except FileNotFoundError:
         return ""
-    txt = p.read_text(encoding="utf-8", errors="ignore")
     if len(txt) > max_chars:
         return txt[:max_chars] + "\n"
     return txt
@@ -62,15 +125,14 @@ def _sha256_text(s: str) -> str:
 
 
 def _diff_touched_files(diff_text: str) -> List[str]:
-    files: List[str] = []
+    # dict as an ordered set: first-seen order, O(1) membership
+    files: Dict[str, None] = {}
     for line in (diff_text or "").splitlines():
         if line.startswith("diff --git "):
-            m = re.match(r"^diff --git a/(.+) b/(.+)\\s*$", line.strip())
+            m = _DIFF_GIT_RE.match(line.strip())
             if m:
-                f = m.group(2).strip()
-                if f not in files:
-                    files.append(f)
-    return files
+                files[m.group(2).strip()] = None
+    return list(files)
 
 
 def _diff_new_files(diff_text: str) -> Set[str]:
@@ -79,7 +141,7 @@ def _diff_new_files(diff_text: str) -> Set[str]:
     saw_new_mode = False
     for line in (diff_text or "").splitlines():
         if line.startswith("diff --git "):
-            m = re.match(r"^diff --git a/(.+) b/(.+)\\s*$", line.strip())
+            m = _DIFF_GIT_RE.match(line.strip())
             cur_file = m.group(2).strip() if m else ""
             saw_new_mode = False
             continue
@@ -120,38 +182,32 @@ def _validate_requirements_install(repo_dir: Path, diff_text: str) -> Tuple[bool
 def _collect_paths_from_evidence(text: str, max_items: int = 50) -> List[str]:
     if not text:
         return []
-    pats = [
-        r"(\\.github/workflows/[A-Za-z0-9_./\\-]+\\.ya?ml)",
-        r"(src/[A-Za-z0-9_./\\-]+\\.py)",
-        r"(tools/[A-Za-z0-9_./\\-]+\\.py)",
-        r"(fd_policy/[A-Za-z0-9_./\\-]+\\.txt)",
-        r"(docs/[A-Za-z0-9_./\\-]+)",
-    ]
-    out: List[str] = []
-    for pat in pats:
-        for m in re.finditer(pat, text):
+    out: Dict[str, None] = {}
+    for lit, rx in _EVIDENCE_PATH_RES:
+        if lit not in text:
+            continue
+        for m in rx.finditer(text):
             pth = m.group(1)
-            if pth and pth not in out:
-                out.append(pth)
+            if pth:
+                out[pth] = None
             if len(out) >= max_items:
-                return out
-    return out
+                return list(out)
+    return list(out)
 
 
 def _compute_allowed_files(workflow_file: str, evidence_text: str, extra_paths: Optional[List[str]] = None) -> List[str]:
-    allowed: List[str] = []
+    allowed: Dict[str, None] = {}
     wf = ".github/workflows/" + workflow_file.strip()
-    if workflow_file.strip() != "" and wf not in allowed:
-        allowed.append(wf)
+    if workflow_file.strip() != "":
+        allowed[wf] = None
     for pth in _collect_paths_from_evidence(evidence_text):
-        if pth not in allowed:
-            allowed.append(pth)
+        allowed[pth] = None
     if extra_paths:
         for pth in extra_paths:
             pth2 = (pth or "").strip()
-            if pth2 != "" and pth2 not in allowed:
-                allowed.append(pth2)
-    return allowed[:80]
+            if pth2 != "":
+                allowed[pth2] = None
+    return list(allowed)[:80]
 
 
 def _expand_related_files(wt_dir: Path, base_paths: List[str]) -> List[str]:
@@ -199,8 +255,10 @@ def _expand_related_files(wt_dir: Path, base_paths: List[str]) -> List[str]:
 
 
 def _read_text_file_limited(path: Path, max_chars: int) -> str:
+    # bounded read: one char past the limit is all the truncation check needs
     try:
-        s = path.read_text(errors="replace")
+        with path.open("r", errors="replace") as f:
+            s = f.read(max_chars + 1 if max_chars > 0 else -1)
     except Exception:
         return ""
     if max_chars > 0 and len(s) > max_chars:
@@ -269,7 +327,7 @@ def _detect_secret_var_flips(diff_text: str) -> List[Tuple[str, str, str]]:
     last_removed = ""
     for line in (diff_text or "").splitlines():
         if line.startswith("diff --git "):
-            m = re.match(r"^diff --git a/(.+) b/(.+)\\s*$", line.strip())
+            m = _DIFF_GIT_RE.match(line.strip())
             if m:
                 cur_file = m.group(2).strip()
             last_removed = ""
@@ -280,12 +338,12 @@ def _detect_secret_var_flips(diff_text: str) -> List[Tuple[str, str, str]]:
         if line.startswith("+") and last_removed:
             rm = last_removed
             add = line
-            m1 = re.search(r"\\$\\{\\{\\s*secrets\\.([A-Za-z0-9_]+)\\s*\\}\\}", rm)
-            m2 = re.search(r"\\$\\{\\{\\s*vars\\.([A-Za-z0-9_]+)\\s*\\}\\}", add)
+            m1 = _FLIP_SECRET_RE.search(rm)
+            m2 = _FLIP_VARS_RE.search(add)
             if m1 and m2 and m1.group(1) == m2.group(1):
                 flips.append(("secrets_to_vars", m1.group(1), cur_file))
-            m3 = re.search(r"\\$\\{\\{\\s*vars\\.([A-Za-z0-9_]+)\\s*\\}\\}", rm)
-            m4 = re.search(r"\\$\\{\\{\\s*secrets\\.([A-Za-z0-9_]+)\\s*\\}\\}", add)
+            m3 = _FLIP_VARS_RE.search(rm)
+            m4 = _FLIP_SECRET_RE.search(add)
             if m3 and m4 and m3.group(1) == m4.group(1):
                 flips.append(("vars_to_secrets", m3.group(1), cur_file))
             last_removed = ""
@@ -310,28 +368,36 @@ def _parse_inputs(s: str) -> Dict[str, str]:
 def _cleanup_pycache(repo_dir: Path, artifacts: Path, label: str) -> None:
     removed_files = 0
     removed_dirs = 0
-    for root, dirs, files in os.walk(str(repo_dir)):
-        dn = [d for d in list(dirs) if d == "__pycache__"]
-        for d in dn:
-            p = Path(root) / d
-            try:
-                shutil.rmtree(str(p))
-                removed_dirs += 1
-            except Exception:
-                pass
-            try:
-                dirs.remove(d)
-            except Exception:
-                pass
-        for f in files:
-            if not f.endswith(".pyc"):
-                continue
-            p2 = Path(root) / f
-            try:
-                p2.unlink()
-                removed_files += 1
-            except Exception:
-                pass
+    # scandir walk: DirEntry carries the file type from readdir, so no per-entry
+    # stat or Path objects; .git holds no bytecode and is not descended.
+    stack = [str(repo_dir)]
+    while stack:
+        top = stack.pop()
+        try:
+            it = os.scandir(top)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    is_dir = e.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if e.name == "__pycache__":
+                        try:
+                            shutil.rmtree(e.path)
+                            removed_dirs += 1
+                        except Exception:
+                            pass
+                    elif e.name != ".git" and not e.is_symlink():
+                        stack.append(e.path)
+                elif e.name.endswith(".pyc"):
+                    try:
+                        os.unlink(e.path)
+                        removed_files += 1
+                    except Exception:
+                        pass
     _write(artifacts / (label + "_pycache_cleanup.log"), "removed_dirs=" + str(removed_dirs) + " removed_files=" + str(removed_files) + "\n")
 
 def _prepare_git_auth(repo_dir: Path, token: str, artifacts: Path, label: str) -> None:
@@ -354,11 +420,7 @@ def _prepare_git_auth(repo_dir: Path, token: str, artifacts: Path, label: str) -
     except Exception:
         pass
     # Set origin URL with PAT token.
-    repo = (os.environ.get("GITHUB_REPOSITORY") or "").strip()
-    if repo == "":
-        raise RuntimeError("FD_FAIL: missing GITHUB_REPOSITORY")
-    remote_url = "https://x-access-token:" + token + "@github.com/" + repo + ".git"
-    subprocess.check_call(["git", "remote", "set-url", "origin", remote_url], cwd=str(repo_dir))
+    _set_origin_with_token(repo_dir, token)
     _step("git_auth_prepared label=" + label)
 
 def _push_with_fallback(wt_dir: Path, repo_root: Path, artifacts: Path, label: str, primary_token: str, fallback_token: str) -> subprocess.CompletedProcess:
@@ -402,12 +464,47 @@ def _read_latest_snapshot(wt_dir: Path) -> str:
         return ""
     return Path(snaps[-1]).read_text(encoding="utf-8", errors="ignore")
 
-def _upload_snapshot_chunks(snapshot_text: str, out_dir: Path) -> None:
+def _snapshot_blocks(snapshot_text: str) -> Dict[str, str]:
+    # rel path -> full "FILE: ... >>>" block, in snapshot order
+    return {m.group(1).strip(): m.group(0) for m in _SNAPSHOT_BLOCK_RE.finditer(snapshot_text)}
+
+def _snapshot_delta(prev_text: str, snapshot_text: str) -> str:
+    # Only the FILE blocks that changed since the previous upload plus removed paths;
+    # "" when nothing changed.
+    old = _snapshot_blocks(prev_text)
+    new = _snapshot_blocks(snapshot_text)
+    changed = [blk for rel, blk in new.items() if old.get(rel) != blk]
+    deleted = [rel for rel in old if rel not in new]
+    if not changed and not deleted:
+        return ""
+    out = "FD_APP_SOURCE_DELTA_V1\n"
+    out += "NOTE: only files changed since the previous SNAPSHOT upload\n\n"
+    out += "\n\n".join(changed)
+    if deleted:
+        out += "\n\nDELETED:\n" + "".join("- " + rel + "\n" for rel in deleted)
+    return out
+
+def _upload_snapshot_chunks(snapshot_text: str, out_dir: Path, state_path: Optional[Path] = None) -> None:
     if snapshot_text.strip() == "":
         return
-    max_chars = int(os.environ.get("FD_SNAPSHOT_MAX_CHARS","180000") or "180000")
-    chunk_chars = int(os.environ.get("FD_SNAPSHOT_CHUNK_CHARS","50000") or "50000")
-    txt = snapshot_text[:max_chars]
+    # state_path keeps the last snapshot sent; later attempts upload only the delta
+    txt = snapshot_text
+    prev = ""
+    if state_path is not None:
+        try:
+            prev = state_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            prev = ""
+        if prev != "":
+            txt = _snapshot_delta(prev, snapshot_text)
+            if txt == "":
+                _step("snapshot_upload_skipped reason=unchanged")
+                return
+            _step("snapshot_upload_delta chars=" + str(len(txt)) + " full_chars=" + str(len(snapshot_text)))
+    max_chars = FD_SNAPSHOT_MAX_CHARS
+    chunk_chars = FD_SNAPSHOT_CHUNK_CHARS
+    truncated = len(txt) > max_chars
+    txt = txt[:max_chars]
     total = (len(txt) + chunk_chars - 1) // chunk_chars
     if total < 1:
         total = 1
@@ -420,27 +517,28 @@ def _upload_snapshot_chunks(snapshot_text: str, out_dir: Path) -> None:
         prompt += "SNAPSHOT_CHUNK " + str(i+1) + "/" + str(total) + "\n"
         prompt += chunk + "\n"
         _write(out_dir / ("snapshot_chunk_" + str(i+1) + "_prompt.txt"), prompt)
-        resp = call_gemini(prompt, timeout_s=900)
+        resp = cached_call(prompt, timeout_s=900)
         _write(out_dir / ("snapshot_chunk_" + str(i+1) + "_response.txt"), resp)
+    if state_path is not None:
+        if not truncated:
+            _write(state_path, snapshot_text)
+        else:
+            # Record only what actually went out: the previous state plus the blocks
+            # that fit whole under the cap. Files cut off stay "unsent" and are offered
+            # again by the next delta; deletions are re-sent until an upload fits.
+            sent = _snapshot_blocks(prev)
+            sent.update(_snapshot_blocks(txt))
+            _write(state_path, "FD_APP_SOURCE_V1\n\n" + "\n\n".join(sent.values()) + "\n")
 
 def _call_gemini_diff(prompt: str, artifacts: Path, label: str) -> str:
     _step("gemini_call_begin label=" + label + " prompt_chars=" + str(len(prompt)))
     _step("gemini_prompt_preview label=" + label + " text=" + _preview(prompt))
     _step("gemini_prompt_file label=" + label + " path=" + str(artifacts / (label + "_prompt.txt")) )
     _write(artifacts / (label + "_prompt.txt"), prompt)
-    resp = call_gemini(prompt, timeout_s=900)
-    _write(artifacts / (label + "_response.txt"), resp)
-    _step("gemini_response_preview label=" + label + " text=" + _preview(resp))
-    _step("gemini_response_file label=" + label + " path=" + str(artifacts / (label + "_response.txt")) )
-    _step("gemini_call_end label=" + label + " resp_chars=" + str(len(resp)))
-    return resp
-
-def _call_gemini_bundle(prompt: str, artifacts: Path, label: str) -> str:
-    _step("gemini_call_begin label=" + label + " prompt_chars=" + str(len(prompt)))
-    _step("gemini_prompt_preview label=" + label + " text=" + _preview(prompt))
-    _step("gemini_prompt_file label=" + label + " path=" + str(artifacts / (label + "_prompt.txt")) )
-    _write(artifacts / (label + "_prompt.txt"), prompt)
-    resp = call_gemini(prompt, timeout_s=900)
+    # not stored here: a rejected fix would otherwise be replayed on every retry whose
+    # prompt comes out identical (same dispatch error, same FD_FAIL reason). The fix
+    # loop stores the answer once it passes validation and git apply --check.
+    resp = cached_call(prompt, timeout_s=900, store_result=False)
     _write(artifacts / (label + "_response.txt"), resp)
     _step("gemini_response_preview label=" + label + " text=" + _preview(resp))
     _step("gemini_response_file label=" + label + " path=" + str(artifacts / (label + "_response.txt")) )
@@ -448,7 +546,7 @@ def _call_gemini_bundle(prompt: str, artifacts: Path, label: str) -> str:
     return resp
 
 def _apply_file_bundle(bundle_text: str, repo_dir: Path, artifacts: Path, label: str) -> bool:
-    t = (bundle_text or "").replace("\r\n","\n").replace("\r","\n")
+    t = normalize_newlines(bundle_text or "")
     ls = t.split("\n")
     i = 0
     wrote = 0
@@ -482,10 +580,10 @@ def _summarize_logs_short(logs_text: str) -> str:
     if not logs_text:
         return ""
     lines = logs_text.splitlines()
-    pats = ["Traceback", "ERROR", "Error:", "FAILED", "FD_FAIL", "Exception"]
+    hit = _SUMMARY_MARKER_RE.search
     hits = []
     for i, line in enumerate(lines):
-        if any(p in line for p in pats):
+        if hit(line):
             start = max(0, i - 2)
             end = min(len(lines), i + 6)
             hits.append("\n".join(lines[start:end]))
@@ -501,13 +599,7 @@ def _summarize_logs_short(logs_text: str) -> str:
     return "\n\n".join(out) + "\n"
 
 def _read_workflow_yaml(repo_dir: Path, workflow_file: str, max_chars: int = 60000) -> str:
-    p = repo_dir / ".github" / "workflows" / workflow_file
-    if not p.exists():
-        return ""
-    txt = p.read_text(encoding="utf-8", errors="ignore")
-    if len(txt) > max_chars:
-        return txt[:max_chars] + "\n"
-    return txt
+    return _read_text_if_exists(repo_dir / ".github" / "workflows" / workflow_file, max_chars)
 
 def _extract_workflow_vars(yaml_text: str) -> Dict[str, List[str]]:
     # Lightweight extraction of referenced secrets/vars/env and inputs usage.
@@ -515,24 +607,11 @@ def _extract_workflow_vars(yaml_text: str) -> Dict[str, List[str]]:
     if not yaml_text:
         return out
 
-    def _add(k: str, v: str) -> None:
-        if v and v not in out[k]:
-            out[k].append(v)
-
-    # secrets.NAME and vars.NAME references
-    for m in re.finditer(r"\$\{\{\s*secrets\.([A-Za-z0-9_]+)\s*\}\}", yaml_text):
-        _add("secrets", m.group(1))
-    for m in re.finditer(r"\$\{\{\s*vars\.([A-Za-z0-9_]+)\s*\}\}", yaml_text):
-        _add("vars", m.group(1))
-    for m in re.finditer(r"\$\{\{\s*env\.([A-Za-z0-9_]+)\s*\}\}", yaml_text):
-        _add("env", m.group(1))
-    for m in re.finditer(r"\$\{\{\s*inputs\.([A-Za-z0-9_]+)\s*\}\}", yaml_text):
-        _add("inputs", m.group(1))
-
-    out["secrets"].sort()
-    out["vars"].sort()
-    out["env"].sort()
-    out["inputs"].sort()
+    found: Dict[str, set] = {k: set() for k in out}
+    for kind, name in _WORKFLOW_REF_RE.findall(yaml_text):
+        found[kind].add(name)
+    for k, names in found.items():
+        out[k] = sorted(names)
     return out
 
 def _extract_workflow_dispatch_inputs(yaml_text: str, max_lines: int = 200) -> str:
@@ -602,57 +681,42 @@ def _extract_failures(logs_text: str, max_items: int = 12) -> str:
     if not logs_text:
         return ""
     lines = logs_text.splitlines()
-    pats = [
-        "FD_FAIL",
-        "FD_POLICY_FAIL",
-        "Traceback",
-        "ERROR",
-        "Error:",
-        "##[error]",
-        "Process completed with exit code",
-        "Unhandled exception",
-    ]
-    out: List[str] = []
+    hit = _FAILURE_MARKER_RE.search
+    out: Dict[str, None] = {}
     for i, line in enumerate(lines):
-        if any(p in line for p in pats):
+        if hit(line):
             start = max(0, i - 2)
             end = min(len(lines), i + 6)
             blk = "\n".join(lines[start:end]).strip()
-            if blk and blk not in out:
-                out.append(blk)
+            if blk:
+                out[blk] = None
         if len(out) >= max_items:
             break
     return "\n\n".join(["-\n" + x for x in out]).strip() + ("\n" if out else "")
 
 def _extract_failed_paths(git_apply_log: str) -> List[str]:
-    paths: List[str] = []
+    paths: Dict[str, None] = {}
     for line in (git_apply_log or "").splitlines():
         if "patch failed:" in line:
             # error: patch failed: path:line
             try:
                 part = line.split("patch failed:",1)[1].strip()
                 p = part.split(":",1)[0].strip()
-                if p and p not in paths:
-                    paths.append(p)
+                if p:
+                    paths[p] = None
             except Exception:
                 pass
         if line.startswith("Checking patch "):
             p = line.replace("Checking patch ","").strip().strip(".")
-            if p and p not in paths:
-                paths.append(p)
-    return paths[:5]
+            if p:
+                paths[p] = None
+    return list(paths)[:5]
 
 def _read_repo_file(repo_dir: Path, rel_path: str, max_chars: int = 8000) -> str:
-    p = repo_dir / rel_path
-    if not p.exists():
-        return ""
-    txt = p.read_text(encoding="utf-8", errors="ignore")
-    if len(txt) > max_chars:
-        return txt[:max_chars] + "\n"
-    return txt
+    return _read_text_if_exists(repo_dir / rel_path, max_chars)
 
 def _normalize_diff(d: str) -> str:
-    t = (d or "").replace("\r\n","\n").replace("\r","\n")
+    t = normalize_newlines(d or "")
     if "diff --git" not in t:
         return t
     lines = t.split("\n")
@@ -660,7 +724,7 @@ def _normalize_diff(d: str) -> str:
         return t
     # Ensure we have ---/+++ headers for git apply.
     # If the first diff block is missing them and jumps straight to @@, inject.
-    m = re.match(r"^diff --git a/(.+) b/(.+)\s*$", lines[0].strip())
+    m = _DIFF_HEADER_RE.match(lines[0].strip())
     if m:
         a_path = "a/" + m.group(1).strip()
         b_path = "b/" + m.group(2).strip()
@@ -674,7 +738,7 @@ def _normalize_diff(d: str) -> str:
     return out
 
 def _extract_diff(text: str) -> str:
-    t = (text or "").replace("\r\n","\n").replace("\r","\n")
+    t = normalize_newlines(text or "")
     idx = t.find("diff --git")
     if idx >= 0:
         d = t[idx:]
@@ -779,9 +843,8 @@ def main() -> int:
                     if aid <= 0:
                         continue
                     _step("download_artifact name=" + name + " id=" + str(aid))
-                    blob = download_artifact_zip(aid, actions_token)
                     outp = artifacts / ("run_" + str(run_id) + "_artifact_" + name + ".zip")
-                    outp.write_bytes(blob)
+                    download_artifact_to_file(aid, actions_token, str(outp))
 
             if (not dispatch_failed) and status == "completed" and conclusion == "success":
                 _step("green run_id=" + str(run_id))
@@ -789,7 +852,7 @@ def main() -> int:
 
             # Prepare context: snapshot + logs + artifacts list
             snapshot_text = _read_latest_snapshot(wt_dir)
-            _upload_snapshot_chunks(snapshot_text, artifacts / ("snapshot_upload_attempt_" + str(attempt)))
+            _upload_snapshot_chunks(snapshot_text, artifacts / ("snapshot_upload_attempt_" + str(attempt)), artifacts / "last_snapshot.txt")
 
             wf_yaml = _read_workflow_yaml(Path(wt_dir), workflow_file)
             used = _extract_workflow_vars(wf_yaml)
@@ -806,26 +869,19 @@ def main() -> int:
             allowed_files = _compute_allowed_files(workflow_file, evidence_all, extra_paths=failed_paths)
             related_files = _expand_related_files(Path(wt_dir), allowed_files + failed_paths)
             related_ctx = _read_related_files_context(Path(wt_dir), related_files)
-            prompt += "You are the Builder fixing an automated GitHub Actions workflow failure.\n"
-            prompt += "\nGOAL\n"
-            prompt += "Make the target workflow run succeed on the target branch with the smallest possible code change.\n"
-            prompt += "\nHARD RULES\n"
-            prompt += "- Output ONLY a standard unified diff (git apply compatible). No markdown. No explanations.\n"
-            prompt += "- FIRST LINE MUST BE: diff --git a/FILE b/FILE\n"
-            prompt += "- Make minimal changes required by evidence. No refactors, renames, or cleanup unless required by logs.\n"
-            prompt += "- Do not change workflow triggers or secrets/vars/env names unless evidence explicitly requires it.\n"
-            prompt += "- You MAY create new files if needed, but you must include them in the unified diff (new file mode + full content).\n"
-            prompt += "- Prefer editing existing files over creating new files. Use REPO_GUIDE and RELATED_FILES to find existing code before adding new files.\n"
-            prompt += "- If this workflow is used by automation, keep it dispatchable: must include on: workflow_dispatch.\n"
-            prompt += "- Base everything on EVIDENCE below.\n"
+            # Invariant text first (rules, contract, repo guide, branch/workflow target) so
+            # every attempt shares one long prefix for Gemini's implicit prompt cache; the
+            # recomputed ALLOWED_FILES, the per-run RUN lines and the evidence follow.
+            prompt = _FIX_PROMPT_RULES
             if contract_txt.strip() != "":
                 prompt += "\nPROJECT_CONTRACT version=" + contract_hash + "\n" + contract_txt + "\n"
             if repo_guide_txt.strip() != "":
                 prompt += "\nREPO_GUIDE version=" + repo_guide_hash + "\n" + repo_guide_txt + "\n"
-            prompt += "\nALLOWED_FILES\n" + "\n".join(["- " + x for x in allowed_files]) + "\n"
             prompt += "\nTARGET\n"
             prompt += "branch: " + branch + "\n"
             prompt += "workflow_file: " + workflow_file + "\n"
+            prompt += "\nALLOWED_FILES\n" + "\n".join(["- " + x for x in allowed_files]) + "\n"
+            prompt += "\nRUN\n"
             if run_id:
                 prompt += "run_id: " + str(run_id) + "\n"
             if html_url:
@@ -926,6 +982,7 @@ def main() -> int:
                 apply_err = chk.stdout[:4000]
                 _step("git_apply_check_failed attempt=" + str(attempt))
                 continue
+            store_response(prompt, diff_text)
 
             # Apply diff in worktree
             app = _run(["git","apply","--3way","--whitespace=nowarn", str(diff_path)], str(wt_dir))